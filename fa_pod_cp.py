@@ -14,6 +14,16 @@ import re
 import datetime
 import json
 import argparse
+import operator
+import asyncio
+import collections
+import concurrent.futures
+import dataclasses
+import functools
+import hashlib
+import shutil
+import time
+import types
 
 import warnings
 warnings.filterwarnings(action='ignore')
@@ -21,6 +31,12 @@ warnings.filterwarnings(action='ignore')
 from pypureclient import flasharray
 import urllib3
 
+# orjson is optional, it parses the config file faster than the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # disable the HTTPS warnings
 urllib3.disable_warnings()
 
@@ -31,16 +47,42 @@ terminate=0
 version = "1.0.0"
 not_defined = "Not Defined"
 
-# main dictionary for script variables
-dictMain={}
+# HTTP connection pool settings shared by every REST call to the Flash Array
+pool_maxsize=16
+pool_retries=urllib3.Retry( total=3, backoff_factor=0.2 )
+
+# number of items requested per page on the listing calls
+page_size=500
+
+# precompiled attribute lookups for the response items
+get_file_system_keys = operator.attrgetter( 'name', 'pod.name' )
+get_export_keys = operator.attrgetter( 'export_name', 'directory.name', 'policy.name' )
+get_rule_keys = operator.attrgetter( 'policy.name', 'name' )
+get_name = operator.attrgetter( 'name' )
+
+# number of independent REST calls in flight at once, must not exceed pool_maxsize
+clone_workers=16
 
-# holds the policy names for the source and target pods
-lst_source_policies=[]
-lst_target_policies=[]
+# safety lock runs read the array inventory from a local cache while it is fresh
+cache_root=os.path.join( os.path.expanduser( '~' ), '.cache', 'fa_pod_cp' )
+cache_minutes=15
+
+
+#
+# state for a single pod clone, created in doMain and passed to the functions that populate it
+#
+
+@dataclasses.dataclass( slots=True )
+class CloneState:
+
+    # holds the policy names for the source and target pods
+    lst_source_policies: list = dataclasses.field( default_factory=list )
+    lst_target_policies: list = dataclasses.field( default_factory=list )
+
+    # holds the file system names for the source and target pods
+    lst_source_pod_file_system_names: list = dataclasses.field( default_factory=list )
+    lst_target_pod_file_system_names: list = dataclasses.field( default_factory=list )
 
-# holds the file system names for the source and target pods
-lst_source_pod_file_system_names=[]
-lst_target_pod_file_system_names=[]
 
 #
 # clean quit
@@ -79,13 +121,13 @@ def mError( halt, return_code, message ):
 
 #
 # read json config file
+# the parsed file is cached on its path and modification time, so it is only re-read when it changes
+# returns the config as a namespace, e.g. config.flash_array_host
 #
 def fReadConnectionJSON( myfile ):
 
     try:
-        with open(myfile, 'r') as file:
-            data = json.load(file)
-            return data
+        return fLoadConnectionJSON( myfile, os.path.getmtime( myfile ))
     except FileNotFoundError:
         print(f'Note: file not found:{myfile}')
         return None
@@ -94,6 +136,17 @@ def fReadConnectionJSON( myfile ):
         return None
 
 
+@functools.lru_cache( maxsize=8 )
+def fLoadConnectionJSON( myfile, mymtime ):
+
+    with open(myfile, 'rb') as file:
+        # orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+        if( orjson != None ): data = orjson.loads( file.read() )
+        else: data = json.load(file)
+
+    return types.SimpleNamespace( **data )
+
+
 ##############################################
 
 # FLASH ARRAY
@@ -112,43 +165,291 @@ def fFAConnect( my_flash_array, my_flash_array_api_token ):
     try:
         array=flasharray.Client( target=my_flash_array, api_token=my_flash_array_api_token )
 
+        mFAConnectionPool( array )
+        mFAJSONDecoder()
+
         response = array.get_volumes()
 
         if ( response.status_code == 200): print( "connected" )
         else: mError( halt, response.status_code, response.reason )
 
-    except:
-        mError( halt, 0, 'fFAConnect failed, please check Flash Array connectivity and API token' )
+    except Exception as e:
+        mError( halt, 0, f'fFAConnect failed ({e}), please check Flash Array connectivity and API token' )
 
     return array
 
 
 
 
+#
+# wraps the Flash Array client with an on-disk cache of the get_* calls
+# the cache lives at ~/.cache/fa_pod_cp/{array}/{endpoint}-{hash of the arguments}.json
+# with use_cache set (safety lock on) fresh entries are served from disk
+# the safety pre-checks (the pod existence check and the array-wide export listing) are always answered live,
+# a stale answer there would repeat an error the user has already fixed
+# any successful post_* or delete_* call removes the cache for the array
+#
+
+class CachedArray:
+
+    def __init__( self, my_flash_array, my_flash_array_api_token, use_cache ):
+
+        self.flash_array = my_flash_array
+        self.flash_array_api_token = my_flash_array_api_token
+        self.use_cache = use_cache
+        self.cache_dir = os.path.join( cache_root, re.sub( r'[^\w.-]', '_', my_flash_array ))
+        self.array = fFAConnect( my_flash_array, my_flash_array_api_token )
+
+    def __getattr__( self, name ):
+
+        if( name.startswith( 'get_' )): return functools.partial( self.fCachedGet, name )
+
+        if( name.startswith( 'post_' ) or name.startswith( 'delete_' )): return functools.partial( self.fInvalidatingCall, name )
+
+        return getattr( self.array, name )
+
+    # the pod check and the unfiltered export listing must never come from the cache
+    def fCacheable( self, my_endpoint, my_kwargs ):
+
+        if( my_endpoint == 'get_pods' ): return False
+
+        if( my_endpoint == 'get_directory_exports' and 'policy_names' not in my_kwargs ): return False
+
+        return self.use_cache
+
+    # serve a get_* call from the cache when allowed and fresh, otherwise call the array and store the result
+    def fCachedGet( self, my_endpoint, **my_kwargs ):
+
+        use_cache = self.fCacheable( my_endpoint, my_kwargs )
+
+        if( use_cache ):
+
+            key = hashlib.sha1( json.dumps( my_kwargs, sort_keys=True, default=str ).encode() ).hexdigest()
+            cache_file = os.path.join( self.cache_dir, f'{my_endpoint}-{key}.json' )
+
+            try:
+                if( time.time() - os.path.getmtime( cache_file ) < cache_minutes*60 ):
+                    with open( cache_file, 'rb' ) as file:
+                        return fCachedResponse( json.loads( file.read() ))
+            except ( OSError, ValueError ):
+                pass
+
+        response = getattr( self.array, my_endpoint )( **my_kwargs )
+
+        if( use_cache and response.status_code == 200 ):
+
+            # the client's items can only be iterated once, so read them into a list
+            # and hand that list back to the caller as well as caching it
+            items = list( response.items )
+            response.items = items
+
+            data = {
+                'status_code': response.status_code,
+                'continuation_token': getattr( response, 'continuation_token', None ),
+                'items': [ item.to_dict() for item in items ],
+            }
+
+            try:
+                os.makedirs( self.cache_dir, exist_ok=True )
+                with open( cache_file, 'w' ) as file:
+                    json.dump( data, file, default=str )
+            except OSError as e:
+                print( f'NOTE: could not write cache file {cache_file}: {e}' )
+
+        return response
+
+    # pass a post_* or delete_* call to the array, the cached inventory is stale once it succeeds
+    def fInvalidatingCall( self, my_endpoint, **my_kwargs ):
+
+        response = getattr( self.array, my_endpoint )( **my_kwargs )
+
+        if( response.status_code == 200 ): shutil.rmtree( self.cache_dir, ignore_errors=True )
+
+        return response
+
+
+
+#
+# rebuild a cached get_* response, the items become namespaces so they read like the client's models
+#
+
+def fCachedResponse( my_data ):
+
+    def fNamespace( my_value ):
+        if( isinstance( my_value, dict )): return types.SimpleNamespace( **{ k: fNamespace( v ) for k, v in my_value.items() } )
+        if( isinstance( my_value, list )): return [ fNamespace( v ) for v in my_value ]
+        return my_value
+
+    return types.SimpleNamespace( status_code=my_data['status_code'], continuation_token=my_data['continuation_token'],
+                                  items=fNamespace( my_data['items'] ))
+
+
+
+
+#
+# swap the client's urllib3 pool for a larger pool with retries
+# so the concurrent get/post/delete calls can each reuse a TCP+TLS connection
+# the TLS settings of the original pool are carried across
+# a ProxyManager (or any other subclass) is left alone, rebuilding it would drop its settings
+#
+
+def mFAConnectionPool( my_array ):
+
+    try:
+        rest_client = my_array._api_client.rest_client
+        pool_kw = dict( rest_client.pool_manager.connection_pool_kw )
+    except AttributeError:
+        pool_kw = None
+
+    if( pool_kw == None or type( rest_client.pool_manager ) is not urllib3.PoolManager ):
+        print( 'NOTE: client does not expose its connection pool, using the default' )
+        return
+
+    for key in ( 'maxsize', 'block', 'retries' ): pool_kw.pop( key, None )
+
+    rest_client.pool_manager = urllib3.PoolManager(
+        maxsize=pool_maxsize,
+        block=False,
+        retries=pool_retries,
+        **pool_kw )
+
+
+
+
+#
+# have pypureclient decode REST responses with orjson when it is installed
+# the client modules are loaded when the client is created, so this runs after that
+# only json.loads is swapped, serialising requests still uses the json module
+#
+
+def mFAJSONDecoder( ):
+
+    if( orjson == None ): return
+
+    json_orjson = types.ModuleType( 'json' )
+    json_orjson.__dict__.update( json.__dict__ )
+    json_orjson.loads = fJSONLoads
+
+    for module in list( sys.modules.values() ):
+        if( getattr( module, '__name__', '' ).startswith( 'pypureclient' ) and getattr( module, 'json', None ) is json ):
+            module.json = json_orjson
+
+
+
+#
+# json.loads replacement, orjson takes no keyword arguments so those calls go to the json module
+# orjson.JSONDecodeError is a subclass of ValueError, as the client expects
+#
+
+def fJSONLoads( my_data, **my_kwargs ):
+
+    if( len( my_kwargs ) > 0 ): return json.loads( my_data, **my_kwargs )
+
+    return orjson.loads( my_data )
+
+
+
+
+#
+# halt unless a REST call returned a 200 status
+#
+
+def mCheckResponse( my_response, my_context ):
+
+    if ( my_response.status_code != 200 ): mError( halt, my_response.status_code, f'{my_context}: {my_response.errors[0].message}' )
+
+
+
+
+#
+# page through a listing call using limit and continuation_token
+# yields the items one page at a time so the whole result set is never held at once
+#
+
+def fIterItems( my_function, my_context, **my_kwargs ):
+
+    continuation_token=None
+
+    while True:
+
+        try:
+            response = my_function( limit=page_size, continuation_token=continuation_token, **my_kwargs )
+        except Exception as e:
+            mError( halt, 0, f'{my_context} failed: {e}' )
+
+        mCheckResponse( response, my_context )
+
+        yield from response.items
+
+        continuation_token = getattr( response, 'continuation_token', None )
+        if( not continuation_token ): break
+
+
+
+
+#
+# run independent REST calls concurrently
+# each job is a (description, function, kwargs) tuple and the function returns the REST response
+# failures are collected and reported once every job has finished, so one failure does not abort the rest
+#
+
+def mRunConcurrent( my_lst_jobs ):
+
+    lst_failures=[]
+
+    lst_results = asyncio.run( fGatherJobs( my_lst_jobs ))
+
+    for ( my_description, my_function, my_kwargs ), result in zip( my_lst_jobs, lst_results ):
+
+        if ( isinstance( result, Exception )): lst_failures.append( f'{my_description}: {result}' )
+        elif ( result.status_code != 200 ): lst_failures.append( f'{my_description}: {result.errors[0].message}' )
+
+    if ( len( lst_failures ) > 0 ): mError( halt, 0, '\n'.join( lst_failures ) )
+
+
+
+#
+# gather the jobs on an event loop, at most clone_workers in flight at once
+# pypureclient is a blocking client, so each call is handed to a worker thread
+# returns the responses, or the exceptions raised, in job order
+#
+
+async def fGatherJobs( my_lst_jobs ):
+
+    asyncio.get_running_loop().set_default_executor( concurrent.futures.ThreadPoolExecutor( max_workers=clone_workers ))
+
+    semaphore = asyncio.Semaphore( clone_workers )
+
+    async def fRunJob( my_function, my_kwargs ):
+        async with semaphore:
+            return await asyncio.to_thread( my_function, **my_kwargs )
+
+    return await asyncio.gather( *[ fRunJob( my_function, my_kwargs ) for my_description, my_function, my_kwargs in my_lst_jobs ], return_exceptions=True )
+
+
+
+
 #
 # check that the source pod exists and that the target pod does not
 #
 
 def mCheckPodExists( my_array, my_source_pod, my_target_pod ):
 
-    source_found=0
-
+    # let the array filter the pod list down to the two pods we care about
+    # a filter (rather than names=) returns a 200 even when one of the pods does not exist
     try:
-        response = my_array.get_pods()
-    except:
-        mError( halt, response.status_code, response.errors[0].message )
+        response = my_array.get_pods( filter=f"name='{my_source_pod}' or name='{my_target_pod}'" )
+    except Exception as e:
+        mError( halt, 0, f'get_pods failed: {e}' )
 
-    if ( response.status_code != 200 ): mError( halt, response.status_code, response.errors[0].message )
+    mCheckResponse( response, 'get_pods' )
 
     #print( response.total_item_count )
-    num_pods=0
-    for mypod in response.items:
-        num_pods += 1
-        if( mypod.name == my_source_pod ): source_found=1
-        if( mypod.name == my_target_pod ): mError( halt, 0, 'target pod '+my_target_pod+' exists, please destroy and eradicate the target, or choose a different target pod name' )
-        #  print( mypod )
+    set_pod_names = { mypod.name for mypod in response.items }
+
+    if( my_target_pod in set_pod_names ): mError( halt, 0, 'target pod '+my_target_pod+' exists, please destroy and eradicate the target, or choose a different target pod name' )
 
-    if ( source_found==0 ): mError( halt, 0, 'source pod '+my_source_pod+' was not found on this Flash Array' )
+    if ( my_source_pod not in set_pod_names ): mError( halt, 0, 'source pod '+my_source_pod+' was not found on this Flash Array' )
 
 
 
@@ -156,37 +457,32 @@ def mCheckPodExists( my_array, my_source_pod, my_target_pod ):
 #
 # find the policies on the source pod
 # for each policy found, replace the source pod name with the target pod name
-# populates the lst_source_policies and lst_target_policies
+# populates my_state.lst_source_policies and my_state.lst_target_policies
 #
 
-def mQueryPolicies( my_array, my_source_pod, my_target_pod ):
+def mQueryPolicies( my_array, my_source_pod, my_target_pod, my_state ):
 
-    try:
-        response = my_array.get_policies_nfs()
-    except:
-        terminate = mError( halt, response.status_code, response.errors[0].message )
+    # pod objects are named POD::OBJECT, so the common case is a prefix swap rather than a full-string replace
+    # this also leaves the object part alone if it happens to contain the pod name
+    source_prefix = my_source_pod+'::'
+    target_prefix = my_target_pod+'::'
+    prefix_len = len( source_prefix )
 
-    if ( response.status_code != 200 ): mError( halt, response.status_code, response.errors[0].message )
+    # let the array return only the policies that belong to the source pod
+    # pair up each source pod policy with its target name in one pass
+    lst_pairs = [ ( policy_name, ( target_prefix+policy_name[prefix_len:] if policy_name.startswith( source_prefix ) else policy_name.replace( my_source_pod, my_target_pod )) )
+                  for policy_name in map( get_name, fIterItems( my_array.get_policies_nfs, 'get_policies_nfs', filter=f"pod.name='{my_source_pod}'" )) ]
 
-    for policy in response.items:
-        # see if this policy is for the source_pod
-        #print( policy )
-        try:
-            pod_policy_name = policy.pod.name
-        except:
-            pod_policy_name = ''
+    for source_policy_name, target_policy_name in lst_pairs: print( 'policy '+source_policy_name )
 
-        if ( pod_policy_name == my_source_pod ):
-            print( 'policy '+policy.name )
-            lst_source_policies.append( policy.name )
-            lst_target_policies.append( policy.name.replace( my_source_pod, my_target_pod ))
+    my_state.lst_source_policies[:], my_state.lst_target_policies[:] = map( list, zip( *lst_pairs )) if lst_pairs else ( [], [] )
 
     # check this pod actually has policies
-    if ( len(lst_source_policies) == 0 ): mError( nohalt, 0, 'source pod does not appear to have any policies' )
+    if ( len(my_state.lst_source_policies) == 0 ): mError( nohalt, 0, 'source pod does not appear to have any policies' )
 
-    print( f'number of policies found:{len(lst_source_policies)}' )
-    #print( lst_source_policies )
-    #print( lst_target_policies )
+    print( f'number of policies found:{len(my_state.lst_source_policies)}' )
+    #print( my_state.lst_source_policies )
+    #print( my_state.lst_target_policies )
 
 
 
@@ -198,75 +494,89 @@ def mQueryPolicies( my_array, my_source_pod, my_target_pod ):
 
 def mQueryNFSClientRules( my_array, my_source_pod, my_lst_source_policies ):
 
-    counter=0
     rules=0
 
-    while( counter < len( my_lst_source_policies )):
+    # an empty policy_names list would return the rules of every policy on the array
+    if( len( my_lst_source_policies ) == 0 ):
+        print( 'no source policies, so no client rules' )
+        return
 
-        mypolicy = my_lst_source_policies[counter];
+    # one call for all of the policies, then group the rules by policy name
+    dict_policy_rules = collections.defaultdict( list )
 
-        print( f'rules for policy:{mypolicy}' )
+    try:
+        response = my_array.get_policies_nfs_client_rules( policy_names=my_lst_source_policies )
+    except Exception as e:
+        mError( halt, 0, f'get_policies_nfs_client_rules failed: {e}' )
 
-        try:
-            response = my_array.get_policies_nfs_client_rules( policy_names=[mypolicy] )
+    mCheckResponse( response, 'get_policies_nfs_client_rules' )
+
+    for rule in response.items:
+    #    print( rule )
+        dict_policy_rules[ rule.policy.name ].append( rule )
 
-            for rule in response.items:
-            #    print( rule )
-                rules+=1
+    for mypolicy in my_lst_source_policies:
 
-        except:
-            print( f'no policies found for:{mypolicy}' )
+        print( f'rules for policy:{mypolicy}' )
 
-        #print( response.items  )
+        if( len( dict_policy_rules[ mypolicy ] ) == 0 ): print( f'no policies found for:{mypolicy}' )
 
-        counter+=1
+        rules += len( dict_policy_rules[ mypolicy ] )
 
     print( f'{rules} rule(s) found' )
 
 
+#
+# get the directory exports for the source pod policies
+# the list is fetched once and shared by mQueryCreateExports and mApplyDirectoryExports
+#
+
+def fQueryDirectoryExports( my_array, my_lst_source_policies ):
+
+    # an empty policy_names list would return every export on the array
+    if( len( my_lst_source_policies ) == 0 ):
+        print( 'no source policies, so no directory exports' )
+        return []
+
+    return list( fIterItems( my_array.get_directory_exports, 'get_directory_exports', policy_names=my_lst_source_policies ))
+
+
+
 #
 # check that the cloned pod export directories do not already exist
 # code will append the export_suffix to each currently exported directory
 # and then make sure an export directory that name does not already exist
+# a single listing of every export on the array answers this for all of them
 #
 
-def mQueryCreateExports( my_array, my_export_suffix, my_lst_source_policies ):
+def mQueryCreateExports( my_array, my_export_suffix, my_cached_exports ):
 
-    # get the directory exports from the source pod
-    try:
-        response = my_array.get_directory_exports( policy_names=my_lst_source_policies )
-    except:
-        mError( halt, response.status_code, response.errors[0].message )
-
-    if ( response.status_code != 200 ): mError( halt, response.status_code, response.errors[0].message )
+    # nothing will be exported, so there is nothing to check
+    if( len( my_cached_exports ) == 0 ):
+        print( 'no source exports, skipping export pre-check' )
+        return
 
-    # step through the exports
-    for my_directory_export in response.items:
+    # convert the export names by appending the export suffix
+    set_target_exports = { my_directory_export.export_name+my_export_suffix for my_directory_export in my_cached_exports }
 
-        # convert the policy and directory names by replacing the source pod name with the target pod name
-        target_export_name = my_directory_export.export_name+my_export_suffix
+    lst_clashing_exports=[]
 
-        # check to see if this export already exists - it should not
-        # we should get a 400 status on this call
-        try:
-            response2 = my_array.get_directory_exports( export_names=[target_export_name] )
-        except:
-            mError( halt, response2.status_code, 'get_directory_exports call returned an error' )
+    # step through every export on the array, noting any that clash with a target export name - they should not
+    for my_directory_export in fIterItems( my_array.get_directory_exports, 'get_directory_exports' ):
 
-        # if we got a 200 code the export already exists under a different pod
-        if( response2.status_code==200 ):
+        if( my_directory_export.export_name in set_target_exports ): lst_clashing_exports.append( my_directory_export )
 
-            print( f'cannot create target export directory:{target_export_name}' )
+    if( len( lst_clashing_exports ) > 0 ):
 
-            # step through the matching records we got back to see which pods this export directory already exists in
-            for my_directory_export_exists in response2.items:
+        # step through the clashing records to see which pods the export directories already exist in
+        for my_directory_export_exists in lst_clashing_exports:
 
-                print( f'directory already exists for policy:{my_directory_export_exists.policy.name}' )
-                print( f'directory already for directory:{my_directory_export_exists.directory.name}' )
-                #print( my_directory_export_exists )
+            print( f'cannot create target export directory:{my_directory_export_exists.export_name}' )
+            print( f'directory already exists for policy:{my_directory_export_exists.policy.name}' )
+            print( f'directory already for directory:{my_directory_export_exists.directory.name}' )
+            #print( my_directory_export_exists )
 
-            #print( response.status_code )
-            mError( halt, response2.status_code, 'select an alternative export suffix' )
+        mError( halt, 0, 'select an alternative export suffix' )
 
 
 
@@ -275,43 +585,45 @@ def mQueryCreateExports( my_array, my_export_suffix, my_lst_source_policies ):
 # find the file systems for the source pod
 # file systems will have the naming convetion POD::FILESYSTEM
 # we will replace the POD with the new pod name and
-# create a list of new filesystems in lst_target_pod_file_system_names
+# create a list of new filesystems in my_state.lst_target_pod_file_system_names
 #
 
-def mQueryFileSystems( my_array, my_source_pod, my_target_pod ):
+def mQueryFileSystems( my_array, my_source_pod, my_target_pod, my_state ):
 
-    try:
-        response = my_array.get_file_systems()
-    except:
-        mError( halt, response.status_code, response.errors[0].message )
+    # precompute the POD:: prefixes for the rename, as in mQueryPolicies
+    source_prefix = my_source_pod+'::'
+    target_prefix = my_target_pod+'::'
+    prefix_len = len( source_prefix )
 
-    if ( response.status_code != 200 ): mError( halt, response.status_code, response.errors[0].message )
+    # step through the file systems on the array a page at a time
+    # for each file system in the source pod generate a new name for the cloned file system
+    lst_pairs = [ ( file_system_name, ( target_prefix+file_system_name[prefix_len:] if file_system_name.startswith( source_prefix ) else file_system_name.replace( my_source_pod, my_target_pod )) )
+                  for file_system_name, pod_name in map( fFileSystemKeys, fIterItems( my_array.get_file_systems, 'get_file_systems' ))
+                  if pod_name == my_source_pod ]
 
-    # step through the list of file systems returned
-    for file_system in response.items:
+    for source_file_system_name, target_file_system_name in lst_pairs: print( f'file system {source_file_system_name}' )
 
-        # try to see if this file system has a pod, some do not
-        try:
-            pod_name = file_system.pod.name
+    my_state.lst_source_pod_file_system_names[:], my_state.lst_target_pod_file_system_names[:] = map( list, zip( *lst_pairs )) if lst_pairs else ( [], [] )
+
+    # check this pod actually has some file systems
+    if ( len(my_state.lst_source_pod_file_system_names) == 0 ): mError( nohalt, 0, 'source pod does not appear to have any NFS file systems' )
 
-            # this file system is part of a pod, check if it is the source_pod
-            if( pod_name == my_source_pod ):
+    print( f'number of source pod file systems found:{len(my_state.lst_source_pod_file_system_names)}' )
 
-                print( f'file system {file_system.name}' )
 
-                # this file system is part of the source pod
-                # add it to the list and generate a new name for the cloned file system
-                lst_source_pod_file_system_names.append( file_system.name )
-                lst_target_pod_file_system_names.append( file_system.name.replace( my_source_pod, my_target_pod ))
 
-        except:
-            pod_name = ''
-            #print( 'not part of a pod' )
 
-    # check this pod actually has some file systems
-    if ( len(lst_source_pod_file_system_names) == 0 ): mError( nohalt, 0, 'source pod does not appear to have any NFS file systems' )
+#
+# return the name and pod name of a file system
+# some file systems are not part of a pod, those have no pod attribute and get a pod name of None
+#
+
+def fFileSystemKeys( my_file_system ):
 
-    print( f'number of source pod file systems found:{len(lst_source_pod_file_system_names)}' )
+    try:
+        return get_file_system_keys( my_file_system )
+    except AttributeError:
+        return ( my_file_system.name, None )
 
 
 
@@ -331,10 +643,10 @@ def mClonePod( my_array, my_source_pod, my_target_pod ):
 
     try:
         response = my_array.post_pods( names=[my_target_pod], pod=mypod )
-    except:
-        mError( halt, response.status_code, response.errors[0].message )
+    except Exception as e:
+        mError( halt, 0, f'post_pods failed: {e}' )
 
-    if ( response.status_code != 200 ): mError( halt, response.status_code, response.errors[0].message )
+    mCheckResponse( response, 'post_pods' )
 
 
 
@@ -345,50 +657,48 @@ def mClonePod( my_array, my_source_pod, my_target_pod ):
 # a suffix is added to the export names
 #
 
-def mApplyDirectoryExports( my_array, safe_mode, my_source_pod, my_target_pod, my_export_suffix, my_lst_source_policies ):
+def mApplyDirectoryExports( my_array, safe_mode, my_source_pod, my_target_pod, my_export_suffix, my_cached_exports ):
 
-    print( f'getting directory exports for {my_source_pod}' )
+    if( len( my_cached_exports ) == 0 ):
+        print( f'no directory exports found for {my_source_pod}' )
+        return
 
-    #print( lst_source_pod_file_system_names )
-
-    #
-    try:
-        response = my_array.get_directory_exports( policy_names=my_lst_source_policies )
-    except:
-        mError( halt, response.status_code, response.errors[0].message )
+    print( f'applying directory exports for {my_source_pod}' )
 
-    if ( response.status_code != 200 ): mError( halt, response.status_code, response.errors[0].message )
+    # precompute the POD:: prefixes for the rename, as in mQueryPolicies
+    source_prefix = my_source_pod+'::'
+    target_prefix = my_target_pod+'::'
+    prefix_len = len( source_prefix )
 
-    # step through the exports
-    for my_directory_export in response.items:
+    # convert the policy and directory names by replacing the source pod name with the target pod name
+    # and add the suffix to the export name, all in one pass over the cached exports
+    lst_exports = [ ( export_name,
+                      export_name+my_export_suffix,
+                      ( target_prefix+directory_name[prefix_len:] if directory_name.startswith( source_prefix ) else directory_name.replace( my_source_pod, my_target_pod )),
+                      ( target_prefix+policy_name[prefix_len:] if policy_name.startswith( source_prefix ) else policy_name.replace( my_source_pod, my_target_pod )) )
+                    for export_name, directory_name, policy_name in map( get_export_keys, my_cached_exports ) ]
 
-        # convert the policy and directory names by replacing the source pod name with the target pod name
-        target_export_name = my_directory_export.export_name+my_export_suffix
-        target_directory_name = my_directory_export.directory.name.replace( my_source_pod, my_target_pod )
-        target_policy_name = my_directory_export.policy.name.replace( my_source_pod, my_target_pod )
+    # check for safety lock, if it is on there is no REST traffic at all
+    if( safe_mode ):
 
-        # create the export name
-        myexport={
-            'export_name': target_export_name,
-            'path': '/',
-        }
+        for source_export_name, target_export_name, target_directory_name, target_policy_name in lst_exports:
+            print( f'NOTE: clone of {source_export_name} would be exported as {target_export_name}' )
 
-        # check for safety lock
-        if( safe_mode ):
+        return
 
-            print( f'NOTE: clone of {my_directory_export.export_name} would be exported as {target_export_name}' )
+    for source_export_name, target_export_name, target_directory_name, target_policy_name in lst_exports:
+        print( f'clone of {source_export_name} will be exported as {target_export_name}' )
 
-        else:
+    lst_jobs = [ ( f'export {target_export_name}', my_array.post_directory_exports,
+                   { 'directory_names': [ target_directory_name ], 'exports': { 'export_name': target_export_name, 'path': '/' }, 'policy_names': [ target_policy_name ] } )
+                 for source_export_name, target_export_name, target_directory_name, target_policy_name in lst_exports ]
 
-            # try to add the export
-            try:
-                response2 = my_array.post_directory_exports( directory_names=[ target_directory_name ], exports=myexport, policy_names=[ target_policy_name ] )
-            except:
-                mError( halt, response2.status_code, response.errors[0].message )
+    # add the exports concurrently
+    if( len( lst_jobs ) > 0 ):
 
-            if ( response2.status_code != 200 ): mError( halt, response2.status_code, response.errors[0].message )
+        mRunConcurrent( lst_jobs )
 
-            print( f'clone of {my_directory_export.export_name} exported as {target_export_name}' )
+        print( f'{len( lst_jobs )} export(s) created' )
 
 
 
@@ -400,6 +710,11 @@ def mApplyDirectoryExports( my_array, safe_mode, my_source_pod, my_target_pod, m
 
 def mChangeExportRules( my_array, my_export_rules, my_target_pod, my_lst_target_policies ):
 
+    # an empty policy_names list would return the rules of every policy on the array
+    if( len( my_lst_target_policies ) == 0 ):
+        print( 'no target policies, so no NFS export rules to change' )
+        return
+
     export_rules = {'rules': my_export_rules}
 
 #    print( export_rules ) 
@@ -407,42 +722,51 @@ def mChangeExportRules( my_array, my_export_rules, my_target_pod, my_lst_target_
     # get a list of policies with NFS rules
     try:
         response = my_array.get_policies_nfs_client_rules( policy_names=my_lst_target_policies )
-    except:
-        mError( halt, response.status_code, response.errors[0].message )
+    except Exception as e:
+        mError( halt, 0, f'get_policies_nfs_client_rules failed: {e}' )
 
-    if ( response.status_code != 200 ): mError( halt, response.status_code, response.errors[0].message )
+    mCheckResponse( response, 'get_policies_nfs_client_rules' )
 
 
-    # for each rule we got back:
+    # group the rules we got back by policy
+    dict_policy_rules = collections.defaultdict( list )
+
     for rule in response.items:
 
         try:
-            rule_name = rule.name
-            rule_policy_name = rule.policy.name
+            rule_policy_name, rule_name = get_rule_keys( rule )
+            dict_policy_rules[ rule_policy_name ].append( rule_name )
+        except AttributeError:
+            print( 'NOTE: rule not changed' )
 
-            print( f'deleting rule:{rule.name} for policy:{rule_policy_name}' )
+    # report the changes here, the worker threads would interleave their output
+    for rule_policy_name, lst_rule_names in dict_policy_rules.items():
+        print( f'deleting rule(s):{",".join( lst_rule_names )} for policy:{rule_policy_name}' )
+        print( f'adding new rule(s) for policy:{rule_policy_name}' )
 
-            # we have to delete the old rule first
-            try:
-                response2 = my_array.delete_policies_nfs_client_rules( names=[rule_name], policy_names=[rule_policy_name] )
-            except:
-                mError( halt, response2.status_code, response.errors[0].message )
+    # one delete and one add per policy, the policies are replaced concurrently
+    lst_jobs = [ ( f'rules for policy {rule_policy_name}', fReplaceExportRules,
+                   { 'my_array': my_array, 'my_lst_rule_names': lst_rule_names, 'my_rule_policy_name': rule_policy_name, 'my_export_rules': export_rules } )
+                 for rule_policy_name, lst_rule_names in dict_policy_rules.items() ]
 
-            if ( response2.status_code != 200 ): mError( halt, response2.status_code, response.errors[0].message )
+    mRunConcurrent( lst_jobs )
 
-            # now we can add a new rule
-            print( f'adding new rule for policy:{rule_policy_name}' )
 
-            try:
-                response3 = my_array.post_policies_nfs_client_rules( policy_names=[rule_policy_name], rules=export_rules )
-            except:
-                mError( halt, response3.status_code, response.errors[0].message )
 
-            if ( response3.status_code != 200 ): mError( halt, response3.status_code, response.errors[0].message )
+#
+# replace the export rules of a single policy
+# we have to delete the old rules first, all in one call, and then we can add the new rules
+# returns the first failing response, or the response of the add
+#
+
+def fReplaceExportRules( my_array, my_lst_rule_names, my_rule_policy_name, my_export_rules ):
 
-        # general catch all
-        except:
-            print( 'NOTE: rule not changed' )
+    response = my_array.delete_policies_nfs_client_rules( names=my_lst_rule_names, policy_names=[my_rule_policy_name] )
+
+    if ( response.status_code != 200 ): return response
+
+    # now we can add the new rules
+    return my_array.post_policies_nfs_client_rules( policy_names=[my_rule_policy_name], rules=my_export_rules )
 
 
 
@@ -474,20 +798,27 @@ def doMain( ):
     #
     # read the config file
     #
-    dictMain={}
-    if( args.config_file != None ): dictMain = fReadConnectionJSON( args.config_file )
+    config=None
+    if( args.config_file != None ): config = fReadConnectionJSON( args.config_file )
+
+    # fall back to the environment variables if the config file could not be read
+    if( config == None ): config = types.SimpleNamespace()
 
     # fa variables
-    flash_array = dictMain.get( "flash_array_host", os.environ.get('FA_HOST') )
-    flash_array_api_token = dictMain.get( "flash_array_api_token", os.environ.get('API_TOKEN') )
+    flash_array = getattr( config, "flash_array_host", os.environ.get('FA_HOST') )
+    flash_array_api_token = getattr( config, "flash_array_api_token", os.environ.get('API_TOKEN') )
 
     if( flash_array==None or flash_array_api_token==None ):
         mQuit( 'flash_array_host and flash_array_api_token need to be defined in the config file or environment variables' )
 
     #
     # connect to the FA
+    # with the safety lock on, the policy, rule, export and file system listings may be served from the local cache
     #
-    myArray = fFAConnect( flash_array, flash_array_api_token )
+    myArray = CachedArray( flash_array, flash_array_api_token, args.execute_lock )
+
+    # holds the policy and file system names for this clone
+    state = CloneState()
 
     #
     # determine the suffix to use for the cloned file systems
@@ -517,7 +848,19 @@ def doMain( ):
     print( '============' )
     print( f'determining relevant policies for {args.source_pod}' )
 
-    mQueryPolicies( myArray, args.source_pod, args.target_pod )
+    mQueryPolicies( myArray, args.source_pod, args.target_pod, state )
+
+
+    # read the directory exports of the source pod once
+    # the cache is valid for the lifetime of this run, nothing in between mutates the source exports
+    cache_directory_exports = []
+
+    if( len( export_suffix ) >0 ):
+
+        print( '============' )
+        print( f'getting directory exports for {args.source_pod}' )
+
+        cache_directory_exports = fQueryDirectoryExports( myArray, state.lst_source_policies )
 
 
 
@@ -525,7 +868,7 @@ def doMain( ):
     print( '============' )
     print( f'determining client rules for NFS policies for {args.source_pod}' )
 
-    mQueryNFSClientRules( myArray, args.source_pod, lst_source_policies )
+    mQueryNFSClientRules( myArray, args.source_pod, state.lst_source_policies )
 
 
 
@@ -535,7 +878,7 @@ def doMain( ):
         print( '============' )
         print( 'checking that target export directories can be created' )
 
-        mQueryCreateExports( myArray, export_suffix, lst_source_policies )
+        mQueryCreateExports( myArray, export_suffix, cache_directory_exports )
 
 
 
@@ -543,7 +886,7 @@ def doMain( ):
     print( '============' )
     print( f'determining file systems for {args.source_pod}' )
 
-    mQueryFileSystems( myArray, args.source_pod, args.target_pod )
+    mQueryFileSystems( myArray, args.source_pod, args.target_pod, state )
 
 
 
@@ -566,30 +909,37 @@ def doMain( ):
 
     #
     # apply the policies to the cloned pod
-    # despite the documentation, this has to be done one at a time.
+    # despite the documentation, this has to be done one policy per call,
+    # the calls are independent so they are run concurrently
     #
 
     print( '============' )
     print( f'cloning policies for {args.target_pod}' )
 
-    policy=0
-    while( policy < len( lst_source_policies )):
+    # the pod may not have any policies
+    if( len( state.lst_source_policies ) == 0 ):
 
-        # check for safety lock
-        if( args.execute_lock ):
+        print( 'no source policies, so no policies to clone' )
 
-            print( f'NOTE: would clone policy {lst_source_policies[policy]} as {lst_target_policies[policy]}' )
+    # check for safety lock
+    elif( args.execute_lock ):
 
-        else:
+        for source_policy, target_policy in zip( state.lst_source_policies, state.lst_target_policies ):
 
-            print( f'cloning policy {lst_source_policies[policy]} as {lst_target_policies[policy]}' )
+            print( f'NOTE: would clone policy {source_policy} as {target_policy}' )
 
-            try:
-                reponse = myArray.post_policies_nfs( names=[lst_target_policies[policy]], source_names=[lst_source_policies[policy]] )
-            except:
-                mError( halt, response.status_code, response.errors[0].message )
+    else:
+
+        lst_jobs=[]
+
+        for source_policy, target_policy in zip( state.lst_source_policies, state.lst_target_policies ):
+
+            print( f'cloning policy {source_policy} as {target_policy}' )
+
+            lst_jobs.append(( f'policy {target_policy}', myArray.post_policies_nfs,
+                              { 'names': [target_policy], 'source_names': [source_policy] } ))
 
-        policy+=1
+        mRunConcurrent( lst_jobs )
 
 
 
@@ -608,8 +958,8 @@ def doMain( ):
 
     else:
 
-        # get the export rules from the dictionary
-        my_export_rules  = dictMain.get( "rules", not_defined )
+        # get the export rules from the config
+        my_export_rules  = getattr( config, "rules", not_defined )
 
         # if we dont have any rules, stop here
         if( my_export_rules == not_defined ):
@@ -619,7 +969,7 @@ def doMain( ):
         else:
 
             print( f'changing NFS export policy rules for {args.target_pod}' )
-            mChangeExportRules( myArray, my_export_rules, args.target_pod, lst_target_policies )
+            mChangeExportRules( myArray, my_export_rules, args.target_pod, state.lst_target_policies )
 
 
 
@@ -638,7 +988,7 @@ def doMain( ):
 
     else:
 
-        mApplyDirectoryExports( myArray, args.execute_lock, args.source_pod, args.target_pod, export_suffix, lst_source_policies )
+        mApplyDirectoryExports( myArray, args.execute_lock, args.source_pod, args.target_pod, export_suffix, cache_directory_exports )
 
     print( '============' )
     print( 'pod cloning complete' )